@@ -1,19 +1,27 @@
+import asyncio
 import gspread
+import httpx
 import openai
 import os
 import re
-import io
+import itertools
+import collections
+import concurrent.futures
 import json
+import shelve
 import smtplib
+import tempfile
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from dotenv import load_dotenv
 from googleapiclient.discovery import build
+from googleapiclient.http import MediaIoBaseDownload, build_http
+import google_auth_httplib2
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google.oauth2 import service_account
-import pickle
+import threading
 import traceback
 import logging
 
@@ -49,12 +57,71 @@ SENDER_PASSWORD = os.getenv("SENDER_PASSWORD")
 RECIPIENT_EMAILS = [email.strip() for email in os.getenv("RECIPIENT_EMAIL", "").split(",") if email.strip()]
 # Progress tracking file
 PROGRESS_FILE = os.getenv("PROGRESS_FILE", "transcription_progress.json")
+# Append-only log of processed rows, folded back into PROGRESS_FILE on startup
+PROGRESS_LOG_FILE = PROGRESS_FILE + ".log"
+# Number of progress log entries written between fsync calls
+PROGRESS_FSYNC_EVERY = 32
+# Seconds to wait between passes over the sheet; 0 runs a single pass and exits
+POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", "0"))
+# Maximum number of files downloaded/transcribed at the same time
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "8"))
+# Number of transcriptions written to the sheet per batch update
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", "50"))
+# Number of passes a cell's sheet update may fail before the transcription is given up on
+WRITE_MAX_ATTEMPTS = 3
+# Size of each chunk requested when downloading audio files from Drive
+DOWNLOAD_CHUNK_SIZE = 1 << 20
+# Size of the pooled keep-alive connection pool used for OpenAI requests
+HTTP_POOL_SIZE = 32
+# Per-request timeout in seconds and retry count for Whisper requests
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_MAX_RETRIES = 2
+# Transcriptions not yet written to the sheet, keyed by Drive file ID, so retries skip Whisper
+TRANSCRIPT_CACHE_FILE = os.getenv("TRANSCRIPT_CACHE_FILE", "transcript_cache")
 # --- END OF CONFIGURATION ---
 
-# If modifying these scopes, delete the file token.pickle.
+# (audio_col, answer_col, audio_col_index, answer_col_index) for each ANSWER_COLUMN_MAP entry,
+# with the 0-based row list indices precomputed for the scan loops
+_COLS = tuple(
+    (audio_col, answer_col, audio_col - 1, answer_col - 1)
+    for audio_col, answer_col in ANSWER_COLUMN_MAP.items()
+)
+
+# Matches the Drive file ID inside a HYPERLINK formula
+_FILE_ID_RE = re.compile(r'd/([a-zA-Z0-9_-]+)/')
+
+# A pending transcription: the row, the answer column to fill and the Drive file ID of its audio
+Job = collections.namedtuple("Job", ["row_index", "answer_col", "file_id"])
+
+# Per-thread state for worker threads (see drive_http)
+_thread_local = threading.local()
+
+# If modifying these scopes, delete the file token.json.
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets',
           'https://www.googleapis.com/auth/drive']
 
+def make_openai_client():
+    """Create the OpenAI client shared by every transcription request."""
+    # OpenAI API Key
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        raise ValueError("OpenAI API key not found. Please set it in the environment variables.")
+    http_client = httpx.AsyncClient(
+        http2=True,
+        limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE)
+    )
+    return openai.AsyncOpenAI(
+        api_key=openai_api_key,
+        http_client=http_client,
+        max_retries=OPENAI_MAX_RETRIES,
+        timeout=OPENAI_TIMEOUT
+    )
+
+def save_token(creds):
+    """Save local OAuth credentials to token.json for the next run."""
+    with open('token.json', 'w') as token:
+        token.write(creds.to_json())
+
 def authenticate():
     """Handles authentication for Google and OpenAI services."""
     try:
@@ -76,13 +143,13 @@ def authenticate():
                     )
             except json.JSONDecodeError:
                 logger.error("Failed to parse GOOGLE_CREDENTIALS as JSON")
-                return None, None
+                return None, None, None, None
         else:
             # Fall back to OAuth flow (for local development)
             creds = None
-            if os.path.exists('token.pickle'):
-                with open('token.pickle', 'rb') as token:
-                    creds = pickle.load(token)
+            if os.path.exists('token.json'):
+                with open('token.json', 'r') as token:
+                    creds = Credentials.from_authorized_user_info(json.load(token), SCOPES)
             
             if not creds or not creds.valid:
                 if creds and creds.expired and creds.refresh_token:
@@ -90,44 +157,92 @@ def authenticate():
                 else:
                     if not os.path.exists('credentials.json'):
                         logger.error("No credentials.json file found")
-                        return None, None
+                        return None, None, None, None
                     flow = InstalledAppFlow.from_client_secrets_file(
                         'credentials.json', SCOPES)
                     creds = flow.run_local_server(port=0)
                 # Save the credentials for the next run
-                with open('token.pickle', 'wb') as token:
-                    pickle.dump(creds, token)
+                save_token(creds)
         
         # Initialize API clients
         gspread_client = gspread.authorize(creds)
         drive_service = build('drive', 'v3', credentials=creds)
         
-        # OpenAI API Key
-        openai.api_key = os.getenv("OPENAI_API_KEY")
-        if not openai.api_key:
-            raise ValueError("OpenAI API key not found. Please set it in the environment variables.")
+        openai_client = make_openai_client()
             
-        return gspread_client, drive_service
+        return gspread_client, drive_service, openai_client, creds
     except Exception as e:
         logger.error(f"An error occurred during authentication: {e}")
-        return None, None
+        return None, None, None, None
 
 def load_progress():
-    """Load the last processed row number from the progress file."""
+    """Load the last processed row number from the progress file and progress log.
+
+    Any rows recorded in the progress log are compacted back into the progress file.
+    """
+    last_row = 1
     if os.path.exists(PROGRESS_FILE):
         with open(PROGRESS_FILE, 'r') as f:
-            return json.load(f)
-    return {"last_processed_row": 1}
+            last_row = json.load(f)["last_processed_row"]
+    if os.path.exists(PROGRESS_LOG_FILE):
+        with open(PROGRESS_LOG_FILE, 'r') as f:
+            logged_rows = [int(line) for line in f if line.strip()]
+        last_row = max([last_row] + logged_rows)
+        save_progress(last_row)
+        os.remove(PROGRESS_LOG_FILE)
+    return {"last_processed_row": last_row}
 
 def save_progress(last_row):
     """Save the last processed row number to the progress file."""
     with open(PROGRESS_FILE, 'w') as f:
         json.dump({"last_processed_row": last_row}, f)
 
+class ProgressLog:
+    """Append-only log of processed rows.
+
+    A row is only recorded once every job in it and in all rows above it has
+    finished, so jobs still in flight are never skipped after a crash.
+    """
+
+    def __init__(self, path, job_rows, last_row):
+        self._file = open(path, 'a')
+        self._unsynced = 0
+        self._last_row = last_row
+        self._recorded_row = 0
+        self._outstanding = collections.Counter(job_rows)
+        self._record()
+
+    def job_done(self, row_index):
+        """Mark one job in the given row as finished."""
+        self._outstanding[row_index] -= 1
+        if not self._outstanding[row_index]:
+            del self._outstanding[row_index]
+        self._record()
+
+    def close(self):
+        """Flush the log to disk and close it."""
+        self._sync()
+        self._file.close()
+
+    def _record(self):
+        completed_row = min(self._outstanding) - 1 if self._outstanding else self._last_row
+        if completed_row <= self._recorded_row:
+            return
+        self._file.write(f"{completed_row}\n")
+        self._recorded_row = completed_row
+        self._unsynced += 1
+        if self._unsynced >= PROGRESS_FSYNC_EVERY:
+            self._sync()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
 def send_summary_email(stats):
     """Send a summary email about the transcription process."""
     if not all([SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD]) or not RECIPIENT_EMAILS:
-        print("Email configuration not found. Skipping email summary.")
+        logger.info("Email configuration not found. Skipping email summary.")
         return
 
     msg = MIMEMultipart()
@@ -156,21 +271,216 @@ def send_summary_email(stats):
         server.login(SENDER_EMAIL, SENDER_PASSWORD)
         server.send_message(msg)
         server.quit()
-        print("Summary email sent successfully.")
+        logger.info("Summary email sent successfully.")
     except Exception as e:
-        print(f"Failed to send summary email: {e}")
+        logger.error("Failed to send summary email: %s", e)
 
-def main():
-    """Main function to run the transcription process."""
-    logger.info("Starting transcription process")
-    
-    gspread_client, drive_service = authenticate()
-    if not gspread_client or not drive_service:
-        logger.error("Failed to authenticate")
-        return
+def fetch_sheet_values(sheet_file, render_option):
+    """Fetch the sheet's cells with the given valueRenderOption in a single batchGet request.
+
+    Returns a row-major list covering columns A up to the last audio/answer column.
+    """
+    last_col = max(max(ANSWER_COLUMN_MAP), max(ANSWER_COLUMN_MAP.values()))
+    last_column_letter = gspread.utils.rowcol_to_a1(1, last_col)[:-1]
+    sheet_range = gspread.utils.absolute_range_name(SHEET_NAME, f"A:{last_column_letter}")
+
+    response = sheet_file.values_batch_get(ranges=[sheet_range], params={'valueRenderOption': render_option})
+    value_ranges = response.get("valueRanges", [])
+    return value_ranges[0].get("values", []) if value_ranges else []
+
+def drive_http(creds):
+    """Return the calling thread's authorized Drive connection, creating it on first use.
+
+    httplib2 connections are not thread-safe, so each worker thread keeps its
+    own and reuses it across downloads.
+    """
+    http = getattr(_thread_local, "drive_http", None)
+    if http is None:
+        # build_http() applies the same socket timeout and redirect handling as build()
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=build_http())
+        _thread_local.drive_http = http
+    return http
+
+def download_file(drive_service, creds, file_id):
+    """Download a file from Google Drive into a temporary file. Runs in a worker thread.
+
+    Chunks are streamed to disk rather than held in memory, so concurrent jobs
+    only keep DOWNLOAD_CHUNK_SIZE bytes each in memory. The caller must close
+    the returned file.
+    """
+    request = drive_service.files().get_media(fileId=file_id)
+    request.http = drive_http(creds)
+    file_content = tempfile.TemporaryFile()
+    try:
+        downloader = MediaIoBaseDownload(file_content, request, chunksize=DOWNLOAD_CHUNK_SIZE)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk()
+    except Exception:
+        file_content.close()
+        raise
+    file_content.seek(0)
+    return file_content
+
+def find_jobs(all_rows, formula_rows, start_row, stats):
+    """Scan the sheet rows after start_row and return a Job for every pending transcription.
+
+    Updates stats with the last scanned row, the number of pending cells and any
+    cells whose formula has no parsable file ID.
+    """
+    # Skip the header and already processed rows
+    jobs = []
+    stats["last_row"] = start_row
+    rows = itertools.zip_longest(all_rows[start_row:], formula_rows[start_row:], fillvalue=[])
+    for row_index, (row, formula_row) in enumerate(rows, start=start_row + 1):
+        stats["last_row"] = row_index
+        for audio_col, answer_col, audio_col_index, answer_col_index in _COLS:
+            # Already transcribed cells are the common case, so check them first
+            answer_cell = row[answer_col_index] if len(row) > answer_col_index else ""
+            if answer_cell:
+                continue
+
+            audio_cell = row[audio_col_index] if len(row) > audio_col_index else ""
+            formula = str(formula_row[audio_col_index]) if len(formula_row) > audio_col_index else ""
+            logger.debug(
+                "Row %d, Audio Col %d (%d): formula=%r | display=%r | Answer Col %d (%d): %r",
+                row_index, audio_col, audio_col_index, formula, audio_cell, answer_col, answer_col_index, answer_cell
+            )
+
+            if (formula and "HYPERLINK" in formula):
+                stats["total_processed"] += 1
+                logger.info("Found pending transcription in row %d, column %d...", row_index, audio_col)
+                # Extract File ID from formula
+                match = _FILE_ID_RE.search(formula)
+                if not match:
+                    logger.warning("Could not parse File ID from cell formula in row %d, column %d.", row_index, audio_col)
+                    stats["failed"] += 1
+                    stats["errors"].append(f"Row {row_index}: Could not parse File ID from cell formula")
+                    continue
+                jobs.append(Job(row_index, answer_col, match.group(1)))
+    return jobs
+
+async def transcribe_file(sem, drive_pool, drive_service, creds, openai_client, transcript_cache, file_id):
+    """Download and transcribe a single Drive audio file.
+
+    Returns (file_id, text), with the exception in place of the text if the file
+    could not be transcribed. Transcriptions already in transcript_cache (from a
+    run whose sheet update failed) are returned without downloading the file again.
+    """
+    cached = transcript_cache.get(file_id)
+    if cached is not None:
+        logger.info("Using cached transcription for file ID: %s", file_id)
+        return file_id, cached["text"]
+
+    async with sem:
+        try:
+            # 1. Download file from Drive
+            logger.info("Downloading file ID: %s", file_id)
+            loop = asyncio.get_running_loop()
+            file_content = await loop.run_in_executor(drive_pool, download_file, drive_service, creds, file_id)
+
+            # 2. Transcribe with Whisper, uploading straight from the temporary file
+            logger.info("Sending file ID %s to Whisper for transcription...", file_id)
+            try:
+                transcript = await openai_client.audio.transcriptions.create(
+                    model="whisper-1",
+                    file=("audio.webm", file_content) # Whisper API needs a file name
+                )
+            finally:
+                file_content.close()
+            transcribed_text = transcript.text
+            # Keep it until the sheet update succeeds
+            transcript_cache[file_id] = {"text": transcribed_text, "write_failures": 0}
+            logger.info("Success! Transcription: '%s...'", transcribed_text[:50])
+            return file_id, transcribed_text
+        except Exception as e:
+            return file_id, e
+
+def flush_writes(sheet, pending_writes, stats):
+    """Write all queued (job, text) transcriptions to the sheet in a single batchUpdate request.
+
+    If the batch is rejected, each cell is retried on its own so that one bad cell
+    (e.g. over the cell size limit or in a protected range) doesn't hold back the
+    rest. Returns (written_jobs, failed_jobs).
+    """
+    if not pending_writes:
+        return [], []
+    batch = pending_writes[:]
+    del pending_writes[:]
+    data = [
+        {'range': gspread.utils.rowcol_to_a1(job.row_index, job.answer_col), 'values': [[text]]}
+        for job, text in batch
+    ]
+    try:
+        sheet.batch_update(data, value_input_option='RAW')
+        logger.info("Updated sheet with %d transcriptions: %s.", len(batch), ", ".join(d['range'] for d in data))
+        stats["successful"] += len(batch)
+        return [job for job, _ in batch], []
+    except Exception as e:
+        if len(batch) == 1:
+            error_msg = f"Failed to update sheet cell {data[0]['range']}: {str(e)}"
+            logger.error("Error: %s", error_msg)
+            stats["failed"] += 1
+            stats["errors"].append(error_msg)
+            return [], [batch[0][0]]
+        logger.warning("Batch update failed (%s), updating the %d cells one at a time", e, len(batch))
 
-    # Initialize statistics
-    stats = {
+    written_jobs, failed_jobs = [], []
+    for (job, text), cell in zip(batch, data):
+        try:
+            sheet.batch_update([cell], value_input_option='RAW')
+            logger.info("Updated sheet at %s.", cell['range'])
+            stats["successful"] += 1
+            written_jobs.append(job)
+        except Exception as e:
+            error_msg = f"Failed to update sheet cell {cell['range']}: {str(e)}"
+            logger.error("Error: %s", error_msg)
+            stats["failed"] += 1
+            stats["errors"].append(error_msg)
+            failed_jobs.append(job)
+    return written_jobs, failed_jobs
+
+def record_flushed_jobs(written_jobs, failed_jobs, progress_log, unwritten_jobs, transcript_cache, stats):
+    """Update the progress log and transcript cache after a flush_writes() call.
+
+    Written jobs are done. Failed jobs stay outstanding, so the next pass retries
+    them from the cache, until their file has failed WRITE_MAX_ATTEMPTS passes;
+    then they are given up on and marked done so progress can move past them.
+    A cached transcription is dropped once every job for its file is done.
+    """
+    done_jobs = list(written_jobs)
+    for file_id in dict.fromkeys(job.file_id for job in failed_jobs):
+        cached = transcript_cache[file_id]
+        cached["write_failures"] += 1
+        transcript_cache[file_id] = cached
+        if cached["write_failures"] >= WRITE_MAX_ATTEMPTS:
+            for job in failed_jobs:
+                if job.file_id == file_id:
+                    error_msg = f"Row {job.row_index}: giving up after {cached['write_failures']} failed sheet updates"
+                    logger.error("Error: %s", error_msg)
+                    stats["errors"].append(error_msg)
+                    done_jobs.append(job)
+
+    for job in done_jobs:
+        progress_log.job_done(job.row_index)
+        unwritten_jobs[job.file_id] -= 1
+        if not unwritten_jobs[job.file_id]:
+            transcript_cache.pop(job.file_id, None)
+
+def drop_stale_transcripts(transcript_cache, pending_file_ids):
+    """Remove cached transcriptions whose file is no longer linked from a pending cell.
+
+    This covers cells filled in by hand and deleted rows, so the cache never holds
+    more than the current pass's pending files.
+    """
+    for file_id in list(transcript_cache.keys()):
+        if file_id not in pending_file_ids:
+            logger.info("Dropping cached transcription for file ID %s, which is no longer pending", file_id)
+            del transcript_cache[file_id]
+
+def new_stats():
+    """Return empty statistics for a transcription pass."""
+    return {
         "total_processed": 0,
         "successful": 0,
         "failed": 0,
@@ -178,83 +488,132 @@ def main():
         "last_row": 0
     }
 
+async def process_once(gspread_client, drive_pool, drive_service, openai_client, creds):
+    """Run a single transcription pass over the sheet and return its statistics."""
+    stats = new_stats()
+
+    # Load the last processed row while the sheet is being fetched
+    progress_task = asyncio.create_task(asyncio.to_thread(load_progress))
+
     try:
         logger.info(f"Attempting to open Google Sheet with ID: {SHEET_ID}")
-        sheet_file = gspread_client.open_by_key(SHEET_ID)
-        logger.info(f"Successfully opened Google Sheet. Attempting to open worksheet: {SHEET_NAME}")
-        sheet = sheet_file.worksheet(SHEET_NAME)
-        logger.info(f"Successfully opened worksheet: {SHEET_NAME}. Fetching all rows...")
-        all_rows = sheet.get_all_values()
+        sheet_file = await asyncio.to_thread(gspread_client.open_by_key, SHEET_ID)
+        logger.info(f"Successfully opened Google Sheet. Opening worksheet {SHEET_NAME} and fetching all rows and formulas...")
+        # The values and formulas are read by range, so they don't have to wait for the worksheet
+        sheet, all_rows, formula_rows = await asyncio.gather(
+            asyncio.to_thread(sheet_file.worksheet, SHEET_NAME),
+            asyncio.to_thread(fetch_sheet_values, sheet_file, 'FORMATTED_VALUE'),
+            asyncio.to_thread(fetch_sheet_values, sheet_file, 'FORMULA'),
+        )
         logger.info("Successfully connected to Google Sheet.")
     except Exception as e:
         error_msg = f"Error accessing Google Sheet: {e!r}"
         logger.error(error_msg)
         stats["errors"].append(error_msg)
-        send_summary_email(stats)
-        return
+        await asyncio.gather(progress_task, return_exceptions=True)
+        return stats
 
-    # Load the last processed row
-    progress = load_progress()
+    progress = await progress_task
     start_row = progress["last_processed_row"]
     logger.info(f"Starting from row {start_row}")
 
-    # Loop through each row in the sheet, skipping the header and already processed rows
-    for row_index, row in enumerate(all_rows[start_row:], start=start_row + 1):
-        stats["last_row"] = row_index
-        for audio_col, answer_col in ANSWER_COLUMN_MAP.items():
-            audio_col_index = audio_col - 1
-            answer_col_index = answer_col - 1
+    # Build the full work list up front, then run it
+    jobs = find_jobs(all_rows, formula_rows, start_row, stats)
+    logger.info(f"Found {len(jobs)} pending transcriptions up to row {stats['last_row']}")
+    if jobs:
+        logger.info(f"First pending transcription is in row {jobs[0].row_index}")
 
-            audio_cell = row[audio_col_index] if len(row) > audio_col_index else ""
-            answer_cell = row[answer_col_index] if len(row) > answer_col_index else ""
-
-            # Fetch the formula for the audio cell
-            formula = sheet.cell(row_index, audio_col, value_render_option='FORMULA').value
-            logger.debug(f"Row {row_index}, Audio Col {audio_col} ({audio_col_index}): formula='{formula}' | display='{audio_cell}' | Answer Col {answer_col} ({answer_col_index}): '{answer_cell}'")
+    # The same audio file can be linked from more than one cell; transcribe it once
+    jobs_by_file = collections.defaultdict(list)
+    for job in jobs:
+        jobs_by_file[job.file_id].append(job)
+    unwritten_jobs = collections.Counter(job.file_id for job in jobs)
 
-            if (formula and "HYPERLINK" in formula and (answer_cell == "")):
-                stats["total_processed"] += 1
-                logger.info(f"Found pending transcription in row {row_index}, column {audio_col}...")
-                try:
-                    # 1. Extract File ID from formula
-                    match = re.search(r'd/([a-zA-Z0-9_-]+)/', formula)
-                    if not match:
-                        logger.warning(f"Could not parse File ID from cell formula.")
-                        stats["failed"] += 1
-                        stats["errors"].append(f"Row {row_index}: Could not parse File ID from cell formula")
+    # Download and transcribe concurrently, batching the sheet updates as results come in.
+    # Jobs whose sheet update fails stay outstanding in the progress log, so the
+    # next pass retries them using the cached transcription (see record_flushed_jobs).
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    pending_writes = []
+    progress_log = ProgressLog(PROGRESS_LOG_FILE, (job.row_index for job in jobs), stats["last_row"])
+    try:
+        with shelve.open(TRANSCRIPT_CACHE_FILE) as transcript_cache:
+            drop_stale_transcripts(transcript_cache, jobs_by_file)
+            try:
+                # Create the tasks up front so they queue on the semaphore in row order
+                # (as_completed would otherwise schedule bare coroutines in arbitrary order)
+                tasks = [
+                    asyncio.create_task(transcribe_file(sem, drive_pool, drive_service, creds, openai_client, transcript_cache, file_id))
+                    for file_id in jobs_by_file
+                ]
+                for task in asyncio.as_completed(tasks):
+                    file_id, result = await task
+                    if isinstance(result, Exception):
+                        for job in jobs_by_file[file_id]:
+                            error_msg = f"Row {job.row_index}: {str(result)}"
+                            logger.error("Error: %s", error_msg)
+                            stats["failed"] += 1
+                            stats["errors"].append(error_msg)
+                            progress_log.job_done(job.row_index)
                         continue
-                    file_id = match.group(1)
-
-                    # 2. Download file from Drive
-                    logger.info(f"Downloading file ID: {file_id}")
-                    request = drive_service.files().get_media(fileId=file_id)
-                    file_content = io.BytesIO(request.execute())
-                    file_content.name = "audio.webm" # Whisper API needs a file name
-
-                    # 3. Transcribe with Whisper
-                    logger.info("Sending to Whisper for transcription...")
-                    transcript = openai.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=file_content
-                    )
-                    transcribed_text = transcript.text
-                    logger.info(f"Success! Transcription: '{transcribed_text[:50]}...'")
-
-                    # 4. Update the Sheet
-                    sheet.update_cell(row_index, answer_col, transcribed_text)
-                    logger.info(f"Updated sheet at row {row_index}, column {answer_col}.")
-                    stats["successful"] += 1
-                except Exception as e:
-                    error_msg = f"Row {row_index}: {str(e)}"
-                    logger.error(f"Error: {error_msg}")
-                    stats["failed"] += 1
-                    stats["errors"].append(error_msg)
 
-        # Save progress after each row
-        save_progress(row_index)
+                    pending_writes.extend((job, result) for job in jobs_by_file[file_id])
+                    if len(pending_writes) >= WRITE_BATCH_SIZE:
+                        written_jobs, failed_jobs = await asyncio.to_thread(flush_writes, sheet, pending_writes, stats)
+                        record_flushed_jobs(written_jobs, failed_jobs, progress_log, unwritten_jobs, transcript_cache, stats)
+            finally:
+                written_jobs, failed_jobs = flush_writes(sheet, pending_writes, stats)
+                record_flushed_jobs(written_jobs, failed_jobs, progress_log, unwritten_jobs, transcript_cache, stats)
+    finally:
+        progress_log.close()
+
+    logger.info("Transcription pass finished.")
+    return stats
+
+async def main():
+    """Main function to run the transcription process."""
+    logger.info("Starting transcription process")
+    
+    gspread_client, drive_service, openai_client, creds = authenticate()
+    if not gspread_client or not drive_service:
+        logger.error("Failed to authenticate")
+        return
+
+    # Drive downloads block, so they run on a dedicated pool whose threads keep
+    # their Drive connections (see drive_http) alive across downloads and passes
+    drive_pool = concurrent.futures.ThreadPoolExecutor(max_workers=MAX_CONCURRENCY, thread_name_prefix="drive")
+    try:
+        while True:
+            try:
+                # Reuse the authenticated clients across passes, refreshing credentials only once they expire
+                if creds.expired:
+                    logger.info("Refreshing expired Google credentials")
+                    await asyncio.to_thread(creds.refresh, Request())
+                    if not os.getenv("GOOGLE_CREDENTIALS"):
+                        save_token(creds)
+
+                stats = await process_once(gspread_client, drive_pool, drive_service, openai_client, creds)
+            except Exception as e:
+                # A failed pass must not stop the long-running worker
+                logger.exception("Transcription pass failed")
+                stats = new_stats()
+                stats["errors"].append(f"Transcription pass failed: {e!r}")
+                if not POLL_INTERVAL:
+                    send_summary_email(stats)
+                    raise
+
+            # When polling, only send a summary for passes that did something
+            if not POLL_INTERVAL or stats["total_processed"] or stats["errors"]:
+                send_summary_email(stats)
+
+            if not POLL_INTERVAL:
+                break
+            logger.info(f"Waiting {POLL_INTERVAL} seconds before the next pass")
+            await asyncio.sleep(POLL_INTERVAL)
+    finally:
+        drive_pool.shutdown(wait=False, cancel_futures=True)
+        await openai_client.close()
 
     logger.info("Transcription process finished.")
-    send_summary_email(stats)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    asyncio.run(main())